@@ -1,5 +1,11 @@
+import bisect
+from array import array
+import collections
+import concurrent.futures
 import os
+import re
 import threading
+import time
 from typing import Dict, Optional, Tuple, List
 
 import sublime
@@ -9,45 +15,142 @@ from .tune_jsonrpc import spawn_tune, JsonRpcClient
 
 # State per view
 # Use type comments for compatibility with older Python runtimes in Sublime
-_current_clients = {}  # type: Dict[int, JsonRpcClient]
+# view id -> (generation, client); a generation identifies one chat run so
+# late callbacks of a killed or replaced run are ignored
+_current_clients = {}  # type: Dict[int, Tuple[int, JsonRpcClient]]
+_clients_lock = threading.Lock()
+_client_generation = 0
 _highlight_key = "tune_generating_text"
-
-# Shared client for suggestions
-_shared_client = None  # type: Optional[JsonRpcClient]
+# Streamed chunks are coalesced and rendered at most this often (~30fps)
+_RENDER_INTERVAL_MS = 33
+# Bound once: called for every streamed chunk
+_set_timeout = sublime.set_timeout
+
+# Role header rows per view, rebuilt only when the buffer changes:
+# view id -> (change_count, sorted role header rows, sorted 'c: ---' rows)
+_role_header_cache = {}  # type: Dict[int, Tuple[int, List[int], List[int]]]
+_ROLES = frozenset({
+    "c", "comment", "s", "system", "u", "user", "a", "assistant",
+    "tc", "tool_call", "tr", "tool_result", "err", "error",
+})
+# Role validation, name and content in one match; longest names first
+_ROLE_LINE_RE = re.compile(
+    r"^\s*(?P<role>{})\s*:(?P<content>.*)$".format(
+        "|".join(sorted(_ROLES, key=lambda r: (-len(r), r)))
+    )
+)
+_DASH_HEADER_RE = re.compile(r"\s*---")
+_MENTION_RE = re.compile(r"@[^@\s]*$")
+
+# view id -> (change_count, line count)
+_line_count_cache = {}  # type: Dict[int, Tuple[int, int]]
+# view id -> (change_count, start point of every row, buffer size); filled by the header scan
+_line_offsets_cache = {}  # type: Dict[int, Tuple[int, array, int]]
+
+# Offered when a line starts with just 'u', 's' or 'c'
+_SNIPPET_ITEMS = [
+    ("user:\tSnippet", "user:\n"),
+    ("system:\tSnippet", "system:\n"),
+    ("c: -----------------------------------------\tSnippet", "c: -----------------------------------------\n"),
+]
+_NEW_TEMPLATE_USER = "user:\n"
+
+# editor/buffers listing, rebuilt only after a buffer is opened, closed or renamed
+_buffers_cache = {"key": None, "value": ""}  # type: Dict[str, object]
+_buffers_generation = 0
+_buffers_lock = threading.Lock()
+
+# editor/buffer text per view, LRU-bounded by total characters:
+# view id -> (change_count, text)
+_buffer_text_cache = collections.OrderedDict()  # type: collections.OrderedDict
+_buffer_text_size = 0
+_buffer_text_limit = 32 * 1024 * 1024
+_buffer_text_lock = threading.Lock()
+
+# @-mention suggestions: only the latest query is sent and answered
+_suggest_state = {"seq": 0}
+_suggest_lock = threading.Lock()
+_SUGGEST_DELAY_MS = 60
+# One long-lived worker: a (re)spawn of the shared client must not stall
+# Sublime's async thread that every other plugin shares
+_suggest_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tune-suggest")
+
+# Shared clients for suggestions and other one-shot requests, one per project
+# folder (None without one) so relative paths resolve like a fresh spawn;
+# past _SHARED_MAX the least recently used is stopped
+_shared_clients = collections.OrderedDict()  # type: collections.OrderedDict
+_SHARED_MAX = 4
 _shared_lock = threading.Lock()
+# Backoff between failed spawns for background callers (seconds), per folder
+_SPAWN_BACKOFF = (1, 5, 30)
+_shared_spawn_state = {}  # type: Dict[Optional[str], Dict[str, float]]
 
 
 def plugin_loaded():
-    global _shared_client
-    with _shared_lock:
-        if _shared_client is None:
-            client, err = spawn_tune(
-                exports={
-                    "resolve": _ctx_resolve,
-                    "read": _ctx_read,
-                },
-                cwd=_get_project_folder()
-            )
-            if err:
-                print("tune: failed to start shared rpc:", err)
-            else:
-                _shared_client = client
+    _, err = _get_or_spawn_shared()
+    if err:
+        print("tune: failed to start shared rpc:", err)
+
+
+def _get_or_spawn_shared(blocking: bool = True) -> Tuple[Optional[JsonRpcClient], Optional[str]]:
+    """Return the shared client for the current project folder, respawning it if it died.
+
+    Non-blocking callers (completions) give up if another thread holds the
+    lock, and don't retry a failed spawn until the backoff has passed.
+    """
+    folder = _get_project_folder()
+    if not _shared_lock.acquire(timeout=-1 if blocking else 0.05):
+        return None, "tune: shared rpc is busy starting"
+    try:
+        client = _shared_clients.get(folder)
+        if client is not None and not client.is_running:
+            _stop_shared(_shared_clients.pop(folder))
+            client = None
+        if client is None:
+            state = _shared_spawn_state.setdefault(folder, {"last_attempt": 0.0, "failures": 0})
+            failures = int(state["failures"])
+            if not blocking and failures:
+                delay = _SPAWN_BACKOFF[min(failures, len(_SPAWN_BACKOFF)) - 1]
+                if time.monotonic() - state["last_attempt"] < delay:
+                    return None, "tune: shared rpc failed to start, retrying later"
+            state["last_attempt"] = time.monotonic()
+            client, err = _spawn_context_client(folder)
+            if err or not client:
+                state["failures"] = failures + 1
+                return None, err
+            del _shared_spawn_state[folder]
+            _shared_clients[folder] = client
+            while len(_shared_clients) > _SHARED_MAX:
+                _stop_shared(_shared_clients.popitem(last=False)[1])
+        else:
+            _shared_clients.move_to_end(folder)
+        return client, None
+    finally:
+        _shared_lock.release()
+
+
+def _stop_shared(client: JsonRpcClient):
+    try:
+        client.stop()
+    except Exception:
+        pass
 
 
 def plugin_unloaded():
-    for v_id, client in list(_current_clients.items()):
+    _suggest_executor.shutdown(wait=False)
+    with _clients_lock:
+        clients = [client for _, client in _current_clients.values()]
+        _current_clients.clear()
+    for client in clients:
         try:
             client.stop()
         except Exception:
             pass
-        _current_clients.pop(v_id, None)
-    global _shared_client
-    if _shared_client is not None:
-        try:
-            _shared_client.stop()
-        except Exception:
-            pass
-        _shared_client = None
+    with _shared_lock:
+        shared = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in shared:
+        _stop_shared(client)
 
 
 # Context exports matching tune.context in nvim
@@ -89,14 +192,9 @@ def _ctx_read(params):
     if name == "editor/filename":
         return view.file_name() or (view.name() or "")
     if name == "editor/buffer":
-        return view.substr(sublime.Region(0, view.size()))
+        return _read_buffer_text(view)
     if name == "editor/buffers":
-        lines = []
-        for w in sublime.windows():
-            for v in w.views():
-                fn = v.file_name() or v.name() or "untitled"
-                lines.append(f"{v.id()} {fn}")
-        return "\n".join(lines)
+        return _read_buffers()
     if name == "editor/selection":
         sel = view.sel()
         if not sel:
@@ -108,6 +206,98 @@ def _ctx_read(params):
     return {"error": "not found"}
 
 
+_CTX_EXPORTS = {
+    "resolve": _ctx_resolve,
+    "read": _ctx_read,
+}
+
+
+def _spawn_context_client(cwd: Optional[str]):
+    """Start tune-sdk with the editor context exports, rooted at `cwd`."""
+    return spawn_tune(exports=_CTX_EXPORTS, cwd=cwd)
+
+
+def _read_buffer_text(view: sublime.View) -> str:
+    global _buffer_text_size
+    vid = view.id()
+    change_count = view.change_count()
+    with _buffer_text_lock:
+        cached = _buffer_text_cache.get(vid)
+        if cached is not None and cached[0] == change_count:
+            _buffer_text_cache.move_to_end(vid)
+            return cached[1]
+    text = view.substr(sublime.Region(0, view.size()))
+    with _buffer_text_lock:
+        old = _buffer_text_cache.pop(vid, None)
+        if old is not None:
+            _buffer_text_size -= len(old[1])
+        _buffer_text_cache[vid] = (change_count, text)
+        _buffer_text_size += len(text)
+        # Evict least recently read views, always keeping the current one
+        while _buffer_text_size > _buffer_text_limit and len(_buffer_text_cache) > 1:
+            _, (_, evicted) = _buffer_text_cache.popitem(last=False)
+            _buffer_text_size -= len(evicted)
+    return text
+
+
+def _forget_buffer_text(vid: int):
+    global _buffer_text_size
+    with _buffer_text_lock:
+        old = _buffer_text_cache.pop(vid, None)
+        if old is not None:
+            _buffer_text_size -= len(old[1])
+
+
+def _invalidate_buffers():
+    global _buffers_generation
+    _buffers_generation += 1
+
+
+def _read_buffers() -> str:
+    with _buffers_lock:
+        key = _buffers_generation
+        if _buffers_cache["key"] != key:
+            _buffers_cache["value"] = "\n".join(
+                f"{v.id()} {v.file_name() or v.name() or 'untitled'}"
+                for w in sublime.windows() for v in w.views()
+            )
+            _buffers_cache["key"] = key
+        return _buffers_cache["value"]
+
+
+def _set_client(vid: int, client: JsonRpcClient) -> int:
+    global _client_generation
+    with _clients_lock:
+        _client_generation += 1
+        _current_clients[vid] = (_client_generation, client)
+        return _client_generation
+
+
+def _pop_client(vid: int, generation: Optional[int] = None) -> Optional[JsonRpcClient]:
+    """Atomically remove the view's client (only if it is still `generation`)."""
+    with _clients_lock:
+        cur = _current_clients.get(vid)
+        if cur is None or (generation is not None and cur[0] != generation):
+            return None
+        del _current_clients[vid]
+        return cur[1]
+
+
+def _stop_client(client: Optional[JsonRpcClient]):
+    if client is None:
+        return
+    try:
+        client.stop()
+    except Exception:
+        pass
+
+
+def _new_template(system_arg: str = "") -> str:
+    if system_arg:
+        return f"system: @@{system_arg}\n" + _NEW_TEMPLATE_USER
+    return _NEW_TEMPLATE_USER
+
+
 # Helpers
 
 def _get_line_regions(view: sublime.View, line_index: int) -> sublime.Region:
@@ -116,43 +306,89 @@ def _get_line_regions(view: sublime.View, line_index: int) -> sublime.Region:
 
 
 def _get_line_count(view: sublime.View) -> int:
+    vid = view.id()
+    change_count = view.change_count()
+    cached = _line_count_cache.get(vid)
+    if cached is not None and cached[0] == change_count:
+        return cached[1]
     # approximate by last row of end point
-    return view.rowcol(view.size())[0] + 1
+    count = view.rowcol(view.size())[0] + 1
+    _line_count_cache[vid] = (change_count, count)
+    return count
+
+
+def _buffer_lines(view: sublime.View) -> List[str]:
+    # One bulk read instead of a substr per line; split on "\n" only so rows
+    # match Sublime's (splitlines would also break on \x0b, \u2028, ...)
+    return view.substr(sublime.Region(0, view.size())).split("\n")
+
+
+def _get_header_rows(view: sublime.View) -> Tuple[List[int], List[int]]:
+    """Return sorted rows of all role headers and of 'c: ---' chat separators."""
+    vid = view.id()
+    change_count = view.change_count()
+    cached = _role_header_cache.get(vid)
+    if cached is not None and cached[0] == change_count:
+        return cached[1], cached[2]
+    rows = []
+    dash_rows = []
+    lines = _buffer_lines(view)
+    # The line count and row offsets come for free with the scan
+    _line_count_cache[vid] = (change_count, len(lines))
+    offsets = array("l")
+    pt = 0
+    for row, line in enumerate(lines):
+        offsets.append(pt)
+        pt += len(line) + 1
+        m = _ROLE_LINE_RE.match(line)
+        if m is None:
+            continue
+        rows.append(row)
+        if m.group("role") in ("c", "comment") and _DASH_HEADER_RE.match(m.group("content")):
+            dash_rows.append(row)
+    _role_header_cache[vid] = (change_count, rows, dash_rows)
+    _line_offsets_cache[vid] = (change_count, offsets, pt - 1)
+    return rows, dash_rows
+
+
+def _get_line_offsets(view: sublime.View) -> Tuple[array, int]:
+    cached = _line_offsets_cache.get(view.id())
+    if cached is None or cached[0] != view.change_count():
+        _get_header_rows(view)
+        cached = _line_offsets_cache[view.id()]
+    return cached[1], cached[2]
+
+
+# Row/point conversion from the offsets table. Only worth it where the header
+# scan runs anyway (split and selection commands); while streaming the buffer
+# changes on every render, so those paths keep using view.text_point().
+
+def _row_to_point(view: sublime.View, row: int) -> int:
+    offsets, size = _get_line_offsets(view)
+    if row >= len(offsets):
+        return size
+    return offsets[max(row, 0)]
+
+
+def _point_to_row(view: sublime.View, pt: int) -> int:
+    offsets, _ = _get_line_offsets(view)
+    return bisect.bisect_right(offsets, pt) - 1
 
 
 def _compute_split_bounds(view: sublime.View, cursor_row: int) -> Tuple[int, int, int]:
     # Mimic Lua logic: s_start, s_mid, s_end within the buffer
-    roles = {
-        "c", "comment", "s", "system", "u", "user", "a", "assistant",
-        "tc", "tool_call", "tr", "tool_result", "err", "error"
-    }
+    rows, dash_rows = _get_header_rows(view)
     total_lines = _get_line_count(view)
-    s_start = 0  # 0-based row index
-    s_mid: Optional[int] = None
-    s_end = total_lines
-
-    # Walk lines to find boundaries
-    import re
-    dash_header = re.compile(r"\s*\-\-\-.*")
-    for idx in range(total_lines):
-        line_region = view.full_line(view.text_point(idx, 0))
-        line_text = view.substr(line_region).rstrip("\n")
-        role = None
-        content = None
-        if ":" in line_text:
-            prefix, rest = line_text.split(":", 1)
-            role = prefix.strip()
-            content = rest
-        if role and role in roles:
-            if s_mid is None and idx > cursor_row:
-                s_mid = idx
-            if role in ("comment", "c") and content is not None and dash_header.match(content):
-                if idx < cursor_row:
-                    s_start = idx + 1
-                if idx > cursor_row and s_end == total_lines:
-                    s_end = idx
-    if s_mid is None:
-        s_mid = s_end
+
+    # s_start: line after the last dash header above the cursor
+    i = bisect.bisect_left(dash_rows, cursor_row)
+    s_start = dash_rows[i - 1] + 1 if i > 0 else 0
+    # s_end: first dash header below the cursor
+    i = bisect.bisect_right(dash_rows, cursor_row)
+    s_end = dash_rows[i] if i < len(dash_rows) else total_lines
+    # s_mid: first role header below the cursor
+    i = bisect.bisect_right(rows, cursor_row)
+    s_mid = rows[i] if i < len(rows) else s_end
     return s_start, s_mid, s_end
 
 
@@ -182,14 +418,53 @@ def _replace_lines(view: sublime.View, start_row: int, end_row: int, new_text: s
     return start_row + added_lines
 
 
+def _common_prefix_len(a: str, b: str) -> int:
+    # Common streaming case: new text extends the old one; startswith
+    # compares in place without copying either string
+    if b.startswith(a):
+        return len(a)
+    if a.startswith(b):
+        return len(b)
+    # A rewrite: bisect, comparing only the window above the known prefix
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a.startswith(b[lo:mid], lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _replace_delta(view: sublime.View, start_pt: int, old_text: str, new_text: str) -> int:
+    # old_text is known to start at start_pt; rewrite only the part that differs.
+    # Returns how many lines were added (negative if removed).
+    prefix = _common_prefix_len(old_text, new_text)
+    if prefix == len(old_text):
+        # Pure extension, the usual streaming case: append without replacing
+        suffix = new_text[prefix:]
+        if suffix:
+            view.run_command("tune_insert_at", {"point": start_pt + prefix, "text": suffix})
+        return suffix.count("\n")
+    view.run_command("tune_replace_region", {
+        "a": start_pt + prefix,
+        "b": start_pt + len(old_text),
+        "text": new_text[prefix:],
+    })
+    return new_text.count("\n", prefix) - old_text.count("\n", prefix)
+
+
 def _highlight_rows(view: sublime.View, start_row: int, end_row: int):
     regions = []
     total = _get_line_count(view)
     start_row = max(0, min(start_row, total))
     end_row = max(0, min(end_row, total))
-    for row in range(start_row, end_row):
-        line = view.full_line(view.text_point(row, 0))
-        regions.append(line)
+    if start_row < end_row:
+        # One region over the whole span draws the same underline as one
+        # region per line, without a full_line call for every row
+        start_pt = view.text_point(start_row, 0)
+        end_pt = view.full_line(view.text_point(end_row - 1, 0)).end()
+        regions.append(sublime.Region(start_pt, end_pt))
     view.add_regions(
         _highlight_key,
         regions,
@@ -204,6 +479,11 @@ class TuneReplaceRegionCommand(sublime_plugin.TextCommand):
         self.view.replace(edit, region, text)
 
 
+class TuneInsertAtCommand(sublime_plugin.TextCommand):
+    def run(self, edit, point: int, text: str):
+        self.view.insert(edit, point, text)
+
+
 class TuneNewCommand(sublime_plugin.WindowCommand):
     def run(self, args: str = ""):
         # Create a new buffer
@@ -212,27 +492,23 @@ class TuneNewCommand(sublime_plugin.WindowCommand):
         v.set_scratch(True)
         # Use correct package resource path
         v.assign_syntax("Packages/tune/syntaxes/Chat.sublime-syntax")
-        initial_text = []
-        if args:
-            initial_text = [f"system: @@{args}", "user:", ""]
-        else:
-            initial_text = ["user:", ""]
-        v.run_command("append", {"characters": "\n".join(initial_text)})
+        initial_text = _new_template(args)
+        v.run_command("append", {"characters": initial_text})
         # Move caret to last line, col 0
+        last_pt = v.text_point(initial_text.count("\n"), 0)
         v.sel().clear()
-        last_row = max(0, len(initial_text) - 1)
-        v.sel().add(sublime.Region(v.text_point(last_row, 0)))
+        v.sel().add(sublime.Region(last_pt))
         self.window.focus_view(v)
-        v.run_command("enter_insert_mode") if hasattr(v, "run_command") else None
+        # Only meaningful with a vi-mode package installed
+        try:
+            v.run_command("enter_insert_mode")
+        except Exception:
+            pass
 
 
 class TuneKillCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        vid = self.view.id()
-        client = _current_clients.get(vid)
-        if client is not None:
-            client.stop()
-            _current_clients.pop(vid, None)
+        _stop_client(_pop_client(self.view.id()))
         self.view.erase_regions(_highlight_key)
 
 
@@ -243,13 +519,7 @@ class TuneSaveCommand(sublime_plugin.TextCommand):
             sublime.status_message(f"Buffer already has a name: {self.view.file_name()}")
             return
 
-        client, err = spawn_tune(
-            exports={
-                "resolve": _ctx_resolve,
-                "read": _ctx_read,
-            },
-            cwd=_get_project_folder()
-        )
+        client, err = _get_or_spawn_shared()
         if err or not client:
             sublime.error_message(f"Tune: error starting RPC: {err}")
             return
@@ -257,15 +527,14 @@ class TuneSaveCommand(sublime_plugin.TextCommand):
         def cb(e, result):
             if e:
                 sublime.error_message(f"Tune: error giving name: {e}")
-                client.stop()
                 return
             filename = (result or {}).get("filename") if isinstance(result, dict) else None
             if filename:
                 # Set as tab name and mark as non-scratch
                 self.view.set_name(filename)
+                _invalidate_buffers()
                 self.view.set_scratch(False)
                 self.view.settings().set("tune.suggested_filename", filename)
-            client.stop()
 
         params = {"filename": "editor-filename.chat", "stop": "assistant", "response": "json"}
         client.file2run(params, False, cb)
@@ -275,65 +544,88 @@ class TuneChatCommand(sublime_plugin.TextCommand):
     def run(self, edit, stop: str = "step"):
         # Kill any existing client for this view
         vid = self.view.id()
-        if vid in _current_clients:
-            try:
-                _current_clients[vid].stop()
-            except Exception:
-                pass
-            _current_clients.pop(vid, None)
+        _stop_client(_pop_client(vid))
 
         # Compute split bounds
         cursor = self.view.sel()[0].begin() if len(self.view.sel()) else 0
-        cursor_row, cursor_col = self.view.rowcol(cursor)
+        cursor_row = _point_to_row(self.view, cursor)
         s_start, s_mid, s_end = _compute_split_bounds(self.view, cursor_row)
 
         # Clear previous highlights
         self.view.erase_regions(_highlight_key)
 
         # Render output helper
-        state = {"s_mid": s_mid, "s_end": s_end, "res": ""}
+        state = {
+            "s_mid": s_mid, "s_end": s_end, "res": "",
+            # text last written at start_pt and the change_count right after it
+            "rendered": None, "start_pt": 0, "change_count": None,
+            "pending": False, "done": False,
+        }
 
         def render_output(completion: str):
             self.view.erase_regions(_highlight_key)
-            new_text = completion
-            # If inserting at a position that is not preceded by a newline,
-            # make sure we start on a new line so we don't append to the
-            # user's last line.
-            try:
+            if state["rendered"] is not None and state["change_count"] == self.view.change_count():
+                # Buffer untouched since our last render: only write the delta
+                state["s_end"] += _replace_delta(self.view, state["start_pt"], state["rendered"], completion)
+            else:
+                lead = ""
                 start_pt = self.view.text_point(state["s_mid"], 0)
-                if start_pt > 0:
-                    prev = self.view.substr(sublime.Region(start_pt - 1, start_pt))
-                    if prev != "\n":
-                        new_text = "\n" + new_text
-            except Exception:
-                pass
-            s_end_new = _replace_lines(self.view, state["s_mid"], state["s_end"], new_text)
-            state["s_end"] = s_end_new
+                # If inserting at a position that is not preceded by a newline,
+                # make sure we start on a new line so we don't append to the
+                # user's last line.
+                try:
+                    if start_pt > 0:
+                        prev = self.view.substr(sublime.Region(start_pt - 1, start_pt))
+                        if prev != "\n":
+                            lead = "\n"
+                except Exception:
+                    pass
+                new_text = lead + completion
+                # Keep the completion on whole rows when something follows it
+                # (e.g. a "c: ---" separator), as the line-based nvim original
+                # does; the newline stays put across delta renders and keeps
+                # s_end on the row after the completion
+                if state["s_end"] < _get_line_count(self.view):
+                    new_text += "\n"
+                _replace_lines(self.view, state["s_mid"], state["s_end"], new_text)
+                # Anchor on the point where completion actually starts: past
+                # a prepended newline, and on the real row even when s_mid
+                # pointed beyond the last line of the buffer
+                state["start_pt"] = start_pt + len(lead)
+                state["s_mid"] = self.view.rowcol(state["start_pt"])[0]
+                state["s_end"] = state["s_mid"] + completion.count("\n") + 1
+            state["rendered"] = completion
+            state["change_count"] = self.view.change_count()
             _highlight_rows(self.view, state["s_mid"], state["s_end"])
-            # move caret to end
-            end_pt = self.view.text_point(state["s_end"], 0)
+            # move caret to the end of the completion, not onto the row after it
+            end_pt = state["start_pt"] + len(completion)
             self.view.sel().clear()
             self.view.sel().add(sublime.Region(end_pt))
             self.view.show(end_pt)
 
+        # Guards "res"/"pending", shared by the RPC thread and the flush timer
+        state_lock = threading.Lock()
+
+        def flush():
+            with state_lock:
+                state["pending"] = False
+                res = state["res"]
+            if state["done"] or not is_current():
+                return
+            render_output(res)
+
         # Spawn client
         filename = self.view.file_name() or (self.view.name() or "")
         # Grab beginning text [s_start, s_mid)
-        begin_region = sublime.Region(self.view.text_point(s_start, 0), self.view.text_point(s_mid, 0))
+        begin_region = sublime.Region(_row_to_point(self.view, s_start), _row_to_point(self.view, s_mid))
         begin_text = self.view.substr(begin_region)
 
-        client, err = spawn_tune(
-            exports={
-                "resolve": _ctx_resolve,
-                "read": _ctx_read,
-            },
-            cwd=_get_project_folder()
-        )
+        client, err = _spawn_context_client(_get_project_folder())
         if err or not client:
             render_output("err: \n" + f"tune: failed to start rpc: {err}")
             return
 
-        _current_clients[vid] = client
+        my_gen = _set_client(vid, client)
 
         params = {
             "text": begin_text.rstrip("\n"),
@@ -344,35 +636,41 @@ class TuneChatCommand(sublime_plugin.TextCommand):
 
         render_output("...")
 
+        def is_current() -> bool:
+            cur = _current_clients.get(vid)
+            return cur is not None and cur[0] == my_gen
+
         def on_chunk(e, chunk):
-            if vid not in _current_clients or _current_clients[vid] is not client:
+            if not is_current():
                 return
             if e:
+                state["done"] = True
                 msg = e.get("stack") or e.get("message") or str(e)
                 r = state["res"] if state["res"] else ""
-                if r:
-                    render_output(r + "\nerr: \n" + msg)
-                else:
-                    render_output("err: \n" + msg)
-                try:
-                    client.stop()
-                except Exception:
-                    pass
-                _current_clients.pop(vid, None)
-                sublime.set_timeout(lambda: self.view.erase_regions(_highlight_key), 50)
+                text = r + "\nerr: \n" + msg if r else "err: \n" + msg
+                # Render on the main thread like every other flush; we may be
+                # on the RPC reader here
+                _set_timeout(lambda: render_output(text), 0)
+                _stop_client(_pop_client(vid, my_gen))
+                _set_timeout(lambda: self.view.erase_regions(_highlight_key), 50)
                 return
             if not chunk:
                 return
             done = bool(chunk.get("done"))
-            state["res"] = chunk.get("value") or ""
-            sublime.set_timeout(lambda: render_output(state["res"]), 0)
+            with state_lock:
+                state["res"] = chunk.get("value") or ""
+                # At most one flush in flight; it picks up the latest value
+                schedule = not done and not state["pending"]
+                if schedule:
+                    state["pending"] = True
             if done:
-                try:
-                    client.stop()
-                except Exception:
-                    pass
-                _current_clients.pop(vid, None)
-                sublime.set_timeout(lambda: self.view.erase_regions(_highlight_key), 50)
+                # Final render right away; any pending flush becomes a no-op
+                state["done"] = True
+                _set_timeout(lambda: render_output(state["res"]), 0)
+                _stop_client(_pop_client(vid, my_gen))
+                _set_timeout(lambda: self.view.erase_regions(_highlight_key), 50)
+            elif schedule:
+                _set_timeout(flush, _RENDER_INTERVAL_MS)
 
         client.file2run(params, True, on_chunk)
 
@@ -380,10 +678,9 @@ class TuneChatCommand(sublime_plugin.TextCommand):
 class TuneCompletions(sublime_plugin.EventListener):
     def on_query_completions(self, view: sublime.View, prefix: str, locations: List[int]):
         # Only in Chat files
-        if view.match_selector(locations[0], "text.chat") is False and view.match_selector(locations[0], "text.prompt") is False:
+        if not view.match_selector(locations[0], "text.chat | text.prompt"):
             return None
 
-        row, col = view.rowcol(locations[0])
         line_region = view.line(locations[0])
         line_text = view.substr(line_region)
         # Use buffer point offset within the line, not the visual column value
@@ -391,34 +688,34 @@ class TuneCompletions(sublime_plugin.EventListener):
 
         # Snippet-like completions when entire line is just 'u'/'s'/'c'
         if before_cursor in ("u", "s", "c") and (locations[0] - line_region.begin()) == 1:
-            items = [
-                ("user:\tSnippet", "user:\n"),
-                ("system:\tSnippet", "system:\n"),
-                ("c: -----------------------------------------\tSnippet", "c: -----------------------------------------\n"),
-            ]
-            return (items, sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+            return (_SNIPPET_ITEMS, sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS)
 
         # @mention completion
-        import re
-        m = re.search(r"@[^@\s]*$", before_cursor)
+        m = _MENTION_RE.search(before_cursor)
         if not m:
             return None
         query = before_cursor[m.start()+1:]
 
         clist = sublime.CompletionList()
+        with _suggest_lock:
+            _suggest_state["seq"] += 1
+            my_seq = _suggest_state["seq"]
+
+        def is_latest() -> bool:
+            return my_seq == _suggest_state["seq"]
 
         def fill():
-            client = _shared_client
-            if client is None:
-                # try start on-demand
-                plugin_loaded()
-            client = _shared_client
+            # Superseded by a newer keystroke while waiting: don't query
+            if not is_latest():
+                clist.set_completions([], 0)
+                return
+            client, _ = _get_or_spawn_shared(blocking=False)
             if client is None:
                 clist.set_completions([], 0)
                 return
 
             def cb(e, result):
-                if e:
+                if e or not is_latest():
                     clist.set_completions([], 0)
                     return
                 items = []
@@ -452,7 +749,15 @@ class TuneCompletions(sublime_plugin.EventListener):
 
             client.suggest({"query": query}, False, cb)
 
-        threading.Thread(target=fill, daemon=True).start()
+        def dispatch():
+            try:
+                _suggest_executor.submit(fill)
+            except RuntimeError:
+                # Executor shut down: plugin is being unloaded
+                clist.set_completions([], 0)
+
+        # Dispatch once typing pauses instead of one request per keystroke
+        sublime.set_timeout_async(dispatch, _SUGGEST_DELAY_MS)
         return clist
 
     def on_modified_async(self, view: sublime.View):
@@ -464,20 +769,21 @@ class TuneCompletions(sublime_plugin.EventListener):
             caret = sel[0].end()
             if caret == 0:
                 return
+            # Cheapest checks first: this runs on every keystroke
+            # Ensure cursor is at column 1 (i.e., we just typed the first character)
+            line_region = view.line(caret)
+            if caret - line_region.begin() != 1:
+                return
+            # Check the just-typed character
+            ch = view.substr(sublime.Region(caret - 1, caret))
+            if ch not in ("u", "s", "c"):
+                return
             # Require the file to be Chat
             if not view.match_selector(caret, "text.chat"):
                 return
             # If AC already showing, don't interfere
             if view.is_auto_complete_visible():
                 return
-            # Check the just-typed character and that it's the first char on the line
-            ch = view.substr(sublime.Region(caret - 1, caret))
-            if ch not in ("u", "s"):
-                return
-            line_region = view.line(caret)
-            # Ensure cursor is at column 1 (i.e., we just typed the first character)
-            if caret - line_region.begin() != 1:
-                return
             # Trigger autocomplete popup for our snippet completions
             view.run_command("auto_complete", {
                 "disable_auto_insert": True,
@@ -496,31 +802,19 @@ class TuneSelectRoleCommand(sublime_plugin.TextCommand):
             return
         if inner:
             start += 1
-        a = self.view.text_point(start, 0)
-        b = self.view.text_point(end, 0)
+        a = _row_to_point(self.view, start)
+        b = _row_to_point(self.view, end)
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(a, self.view.line(b).end()))
         self.view.show(self.view.sel()[0])
 
     def _find_role_bounds(self) -> Tuple[Optional[int], int]:
-        roles = {"c", "comment", "s", "system", "u", "user", "a", "assistant", "tc", "tool_call", "tr", "tool_result", "err", "error"}
         total = _get_line_count(self.view)
-        cur = self.view.rowcol(self.view.sel()[0].begin())[0]
-        lines = [self.view.substr(self.view.line(self.view.text_point(i, 0))) for i in range(total)]
-        start_line = None
-        end_line = total - 1
-        for i in range(cur, -1, -1):
-            line = lines[i]
-            role = line.split(":", 1)[0] if ":" in line else None
-            if role and role in roles:
-                start_line = i
-                break
-        for i in range(cur + 1, total):
-            line = lines[i]
-            role = line.split(":", 1)[0] if ":" in line else None
-            if role and role in roles:
-                end_line = i - 1
-                break
+        cur = _point_to_row(self.view, self.view.sel()[0].begin())
+        rows, _ = _get_header_rows(self.view)
+        i = bisect.bisect_right(rows, cur)
+        start_line = rows[i - 1] if i > 0 else None
+        end_line = rows[i] - 1 if i < len(rows) else total - 1
         return start_line, end_line
 
 
@@ -528,69 +822,48 @@ class TuneSelectChatCommand(sublime_plugin.TextCommand):
     def run(self, edit, inner: bool = False):
         start, end, header = self._find_chat_bounds()
         if inner:
-            a = self.view.text_point(start, 0)
+            a = _row_to_point(self.view, start)
         else:
-            a = self.view.text_point(header if header is not None else start, 0)
-        b = self.view.text_point(end, 0)
+            a = _row_to_point(self.view, header if header is not None else start)
+        b = _row_to_point(self.view, end)
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(a, self.view.line(b).end()))
         self.view.show(self.view.sel()[0])
 
     def _find_chat_bounds(self) -> Tuple[int, int, Optional[int]]:
         total = _get_line_count(self.view)
-        cur = self.view.rowcol(self.view.sel()[0].begin())[0]
+        cur = _point_to_row(self.view, self.view.sel()[0].begin())
+        _, dash_rows = _get_header_rows(self.view)
         header_line = None
         start_line = 0
         end_line = total - 1
-        import re
-        for i in range(cur, -1, -1):
-            text = self.view.substr(self.view.line(self.view.text_point(i, 0)))
-            if ":" in text:
-                r, c = text.split(":", 1)
-                if r.strip() in ("c", "comment") and re.match(r"\s*\-\-\-.*", c):
-                    start_line = i + 1
-                    header_line = i
-                    break
-        for i in range(cur + 1, total):
-            text = self.view.substr(self.view.line(self.view.text_point(i, 0)))
-            if ":" in text:
-                r, c = text.split(":", 1)
-                if r.strip() in ("c", "comment") and re.match(r"\s*\-\-\-.*", c):
-                    end_line = i - 1
-                    break
+        i = bisect.bisect_right(dash_rows, cur)
+        if i > 0:
+            header_line = dash_rows[i - 1]
+            start_line = header_line + 1
+        if i < len(dash_rows):
+            end_line = dash_rows[i] - 1
         return start_line, end_line, header_line
 
 
 class TuneSelectTailCommand(sublime_plugin.TextCommand):
     def run(self, edit, inner: bool = False):
         start, end = self._find_tail_bounds(inner)
-        a = self.view.text_point(start, 0)
-        b = self.view.text_point(end, 0)
+        a = _row_to_point(self.view, start)
+        b = _row_to_point(self.view, end)
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(a, self.view.line(b).end()))
         self.view.show(self.view.sel()[0])
 
     def _find_tail_bounds(self, inner: bool) -> Tuple[int, int]:
-        roles = {"c", "comment", "s", "system", "u", "user", "a", "assistant", "tc", "tool_call", "tr", "tool_result", "err", "error"}
         total = _get_line_count(self.view)
-        cur = self.view.rowcol(self.view.sel()[0].begin())[0]
-        start_line = cur
-        for i in range(cur, -1, -1):
-            text = self.view.substr(self.view.line(self.view.text_point(i, 0)))
-            role = text.split(":", 1)[0] if ":" in text else None
-            if role and role.strip() in roles:
-                start_line = i
-                break
+        cur = _point_to_row(self.view, self.view.sel()[0].begin())
+        rows, dash_rows = _get_header_rows(self.view)
+        i = bisect.bisect_right(rows, cur)
+        start_line = rows[i - 1] if i > 0 else cur
         # find end chat boundary
-        import re
-        end_line = total - 1
-        for i in range(cur + 1, total):
-            text = self.view.substr(self.view.line(self.view.text_point(i, 0)))
-            if ":" in text:
-                r, c = text.split(":", 1)
-                if r.strip() in ("c", "comment") and re.match(r"\s*\-\-\-.*", c):
-                    end_line = i - 1
-                    break
+        i = bisect.bisect_right(dash_rows, cur)
+        end_line = dash_rows[i] - 1 if i < len(dash_rows) else total - 1
         if inner:
             start_line = start_line + 1
         return start_line, end_line
@@ -605,13 +878,7 @@ class TuneAutoSaveCommand(sublime_plugin.TextCommand):
             return
         
         # Otherwise, get a suggested filename
-        client, err = spawn_tune(
-            exports={
-                "resolve": _ctx_resolve,
-                "read": _ctx_read,
-            },
-            cwd=_get_project_folder()
-        )
+        client, err = _get_or_spawn_shared()
         if err or not client:
             # Fall back to normal save dialog
             self.view.window().run_command("save_as")
@@ -619,13 +886,11 @@ class TuneAutoSaveCommand(sublime_plugin.TextCommand):
 
         def cb(e, result):
             if e:
-                client.stop()
                 # Fall back to normal save dialog
                 sublime.set_timeout(lambda: self.view.window().run_command("save_as"), 0)
                 return
             
             filename = (result or {}).get("filename") if isinstance(result, dict) else None
-            client.stop()
             
             if not filename:
                 # No suggestion available, use normal save dialog
@@ -641,6 +906,7 @@ class TuneAutoSaveCommand(sublime_plugin.TextCommand):
             
             # Set the name and open save dialog with suggested path
             self.view.set_name(filename)
+            _invalidate_buffers()
             win = self.view.window()
             if win is None:
                 return
@@ -661,11 +927,27 @@ class TuneAutoSaveCommand(sublime_plugin.TextCommand):
 class TuneCleanupListener(sublime_plugin.EventListener):
     def on_close(self, view: sublime.View):
         vid = view.id()
-        client = _current_clients.get(vid)
-        if client is not None:
-            try:
-                client.stop()
-            except Exception:
-                pass
-            _current_clients.pop(vid, None)
+        _role_header_cache.pop(vid, None)
+        _line_count_cache.pop(vid, None)
+        _line_offsets_cache.pop(vid, None)
+        _forget_buffer_text(vid)
+        _stop_client(_pop_client(vid))
         view.erase_regions(_highlight_key)
+
+
+class TuneBuffersListener(sublime_plugin.EventListener):
+    # Any of these may change what editor/buffers reports
+    def on_new(self, view: sublime.View):
+        _invalidate_buffers()
+
+    def on_load(self, view: sublime.View):
+        _invalidate_buffers()
+
+    def on_activated(self, view: sublime.View):
+        _invalidate_buffers()
+
+    def on_post_save(self, view: sublime.View):
+        _invalidate_buffers()
+
+    def on_close(self, view: sublime.View):
+        _invalidate_buffers()
@@ -1,13 +1,163 @@
+import collections
+import concurrent.futures
+import functools
+import itertools
 import json
 import os
+import queue
+import selectors
 import shutil
 import subprocess
 import threading
-from typing import Any, Callable, Dict, Optional
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# orjson is much faster on the per-frame hot path but is not bundled with
+# Sublime; fall back to the stdlib when it isn't importable
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Both work on UTF-8 bytes, the pipes are binary
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _json_dumps(payload: Any) -> bytes:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+else:
+    # No object_pairs_hook to intern keys: a Python call per object costs more
+    # than the string compares it would save on the few msg.get() lookups
+    _json_loads = json.loads
+
+    def _json_dumps(payload: Any) -> bytes:
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=64)
+def _envelope_prefix(method: str, stream: bool) -> bytes:
+    """Encoded request fields that only depend on (method, stream), up to the id."""
+    return (
+        b'{"jsonrpc":"2.0","method":'
+        + _json_dumps(method)
+        + (b',"stream":true' if stream else b',"stream":false')
+        + b',"id":'
+    )
+
+
+# Windows pipes can't go through select(); there stdout and stderr each get
+# a reader thread
+_SELECT_PIPES = os.name != "nt"
+
+# Scatter-gather writes; not available on Windows
+_writev = getattr(os, "writev", None)
+# Most platforms cap a single writev at 1024 buffers
+_IOV_MAX = 1024
+
+
+def _writev_all(fd: int, bufs: List[Any]):
+    """writev every buffer, resuming after short writes."""
+    i = 0
+    while i < len(bufs):
+        n = _writev(fd, bufs[i:i + _IOV_MAX])
+        while i < len(bufs) and n >= len(bufs[i]):
+            n -= len(bufs[i])
+            i += 1
+        if n:
+            bufs[i] = memoryview(bufs[i])[n:]
+
 
 # Lightweight JSON-RPC 2.0 client over stdio with newline-delimited JSON
 
 
+class _CallbackSlots:
+    """Callbacks keyed by our dense, increasing request ids.
+
+    Stored in a power-of-two ring indexed by `id & mask` rather than a dict;
+    it doubles when 3/4 full. An id whose slot is still held by an older
+    in-flight id (e.g. a long stream) goes to a small overflow dict instead,
+    so nothing is overwritten and the ring doesn't grow with request count.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        # (slots, mask) is swapped as one object so lock-free reads stay consistent
+        self._table = ([None] * capacity, capacity - 1)  # type: Tuple[List[Optional[Tuple[int, Callable]]], int]
+        self._overflow: Dict[int, Callable] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def put(self, msg_id: int, callback: Callable):
+        with self._lock:
+            if (self._count + 1) * 4 > len(self._table[0]) * 3:
+                self._grow()
+            # A repeated id replaces its entry wherever it lives
+            if msg_id in self._overflow:
+                self._overflow[msg_id] = callback
+                return
+            slots, mask = self._table
+            slot = slots[msg_id & mask]
+            if slot is None:
+                slots[msg_id & mask] = (msg_id, callback)
+            elif slot[0] == msg_id:
+                slots[msg_id & mask] = (msg_id, callback)
+                return
+            else:
+                self._overflow[msg_id] = callback
+            self._count += 1
+
+    def get(self, msg_id: Any) -> Optional[Callable]:
+        if not isinstance(msg_id, int):
+            return None
+        slots, mask = self._table
+        slot = slots[msg_id & mask]
+        if slot is not None and slot[0] == msg_id:
+            return slot[1]
+        return self._overflow.get(msg_id) if self._overflow else None
+
+    def pop(self, msg_id: Any) -> Optional[Callable]:
+        if not isinstance(msg_id, int):
+            return None
+        with self._lock:
+            slots, mask = self._table
+            slot = slots[msg_id & mask]
+            if slot is not None and slot[0] == msg_id:
+                slots[msg_id & mask] = None
+                self._count -= 1
+                return slot[1]
+            callback = self._overflow.pop(msg_id, None)
+            if callback is not None:
+                self._count -= 1
+            return callback
+
+    def drain(self) -> List[Callable]:
+        """Remove and return every registered callback."""
+        with self._lock:
+            slots, _ = self._table
+            callbacks = [slot[1] for slot in slots if slot is not None]
+            callbacks.extend(self._overflow.values())
+            self._table = ([None] * len(slots), len(slots) - 1)
+            self._overflow = {}
+            self._count = 0
+            return callbacks
+
+    def _grow(self):
+        slots, _ = self._table
+        size = len(slots) * 2
+        new_slots = [None] * size  # type: List[Optional[Tuple[int, Callable]]]
+        for slot in slots:
+            if slot is not None:
+                new_slots[slot[0] & (size - 1)] = slot
+        # Overflowed ids move into the ring where their new slot is free
+        overflow = {}
+        for msg_id, callback in self._overflow.items():
+            if new_slots[msg_id & (size - 1)] is None:
+                new_slots[msg_id & (size - 1)] = (msg_id, callback)
+            else:
+                overflow[msg_id] = callback
+        self._table = (new_slots, size - 1)
+        self._overflow = overflow
+
+
 class JsonRpcClient:
     def __init__(
         self,
@@ -21,18 +171,34 @@ class JsonRpcClient:
         self.cwd = cwd
         self.env = env
         self.process: Optional[subprocess.Popen] = None
+        # Liveness as a plain attribute so the per-call check is not a waitpid;
+        # cleared by stop(), at stdout EOF, and by the readers' periodic poll()
+        self._alive = False
         self._reader_thread: Optional[threading.Thread] = None
         self._stderr_thread: Optional[threading.Thread] = None
-        self._write_lock = threading.Lock()
-        self._id = 1
-        self._callbacks: Dict[int, Callable] = {}
-        self._iters: Dict[int, Callable] = {}
+        self._writer_thread: Optional[threading.Thread] = None
+        # Runs server->client requests so slow exports don't hold up the reader
+        self._export_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        # Encoded frames for the writer thread; None tells it to exit
+        self._wq: queue.SimpleQueue = queue.SimpleQueue()
+        # next() on a count is atomic, so ids stay unique when the main
+        # thread and worker threads share one client
+        self._ids = itertools.count(1)
+        self._callbacks = _CallbackSlots()
+        self._iters = _CallbackSlots()
+        # Reused for every streamed chunk; iterators run synchronously on the
+        # reader thread and must not keep a reference to it
+        self._chunk: Dict[str, Any] = {"value": None, "done": False}
         self._closing = False
-        self._errbuf = []
+        # Only the tail of stderr matters for the exit error report
+        self._errbuf: Deque[str] = collections.deque(maxlen=256)
+        # Methods the editor calls; bind them up front
+        for name in ("init", "file2run", "suggest"):
+            getattr(self, name)
 
     @property
     def is_running(self):
-        return self.process is not None and self.process.poll() is None
+        return self._alive
 
     def start(self) -> Optional[str]:
         try:
@@ -45,28 +211,44 @@ class JsonRpcClient:
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                bufsize=1,
-                universal_newlines=True,
                 cwd=self.cwd,
                 env=proc_env,
             )
         except Exception as e:
             return str(e)
-
-        self._reader_thread = threading.Thread(
-            target=self._read_stdout, name="tune-rpc-stdout", daemon=True
+        self._alive = True
+        self._export_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="tune-rpc-export"
         )
-        self._reader_thread.start()
-        self._stderr_thread = threading.Thread(
-            target=self._read_stderr, name="tune-rpc-stderr", daemon=True
+
+        if _SELECT_PIPES:
+            self._reader_thread = threading.Thread(
+                target=self._read_pipes, name="tune-rpc-reader", daemon=True
+            )
+            self._reader_thread.start()
+        else:
+            self._reader_thread = threading.Thread(
+                target=self._read_stdout, name="tune-rpc-stdout", daemon=True
+            )
+            self._reader_thread.start()
+            self._stderr_thread = threading.Thread(
+                target=self._read_stderr, name="tune-rpc-stderr", daemon=True
+            )
+            self._stderr_thread.start()
+        self._writer_thread = threading.Thread(
+            target=self._write_loop, args=(self.process.stdin,), name="tune-rpc-stdin", daemon=True
         )
-        self._stderr_thread.start()
+        self._writer_thread.start()
         return None
 
     def stop(self):
         self._closing = True
+        self._alive = False
+        self._wq.put(None)
+        if self._export_pool is not None:
+            self._export_pool.shutdown(wait=False)
         try:
-            if self.process and self.is_running:
+            if self.process and self.process.poll() is None:
                 self.process.terminate()
                 # Give it a moment, then kill if needed
                 try:
@@ -78,9 +260,15 @@ class JsonRpcClient:
 
     # Dynamic RPC method: client.<method>(params, stream=False, callback)
     def __getattr__(self, name: str):
+        # Keep copy/pickle protocol probes from turning into RPC methods
+        if name.startswith("__"):
+            raise AttributeError(name)
+
         def _call(params: Any = None, stream: bool = False, callback: Optional[Callable] = None):
             self._call(name, params, stream, callback)
 
+        # Cache on the instance so later lookups never reach __getattr__
+        self.__dict__[name] = _call
         return _call
 
     def _call(self, method: str, params: Any, stream: bool, callback: Optional[Callable]):
@@ -88,108 +276,278 @@ class JsonRpcClient:
             if callback:
                 callback({"message": "process not running"}, None)
             return
-        msg_id = self._id
-        self._id += 1
+        msg_id = next(self._ids)
         if callback:
             if stream:
-                self._iters[msg_id] = callback
+                self._iters.put(msg_id, callback)
             else:
-                self._callbacks[msg_id] = callback
-        payload = {
-            "jsonrpc": "2.0",
-            "id": msg_id,
-            "method": method,
-            "params": params,
-            "stream": bool(stream),
-        }
-        self._write_json(payload)
+                self._callbacks.put(msg_id, callback)
+        # Only params go through the JSON encoder: the rest of the envelope is
+        # cached bytes and the id is formatted straight into bytes
+        self._write_frame(
+            _envelope_prefix(method, bool(stream))
+            + b"%d" % msg_id
+            + b',"params":'
+            + _json_dumps(params)
+            + b"}"
+        )
 
     def _write_json(self, payload: Dict[str, Any]):
+        self._write_frame(_json_dumps(payload))
+
+    def _write_frame(self, frame: bytes):
         if not self.is_running:
             return
-        data = json.dumps(payload, ensure_ascii=False)
-        with self._write_lock:
+        self._wq.put(frame)
+
+    def _write_loop(self, stdin):
+        # Drain whatever queued up since the last write and send it with one
+        # write + flush instead of a syscall per frame. Where writev exists the
+        # frames go out as-is, gathered with separators, without joining them
+        # into one more copy first.
+        # Bound once; everything below runs per frame
+        get = self._wq.get
+        get_nowait = self._wq.get_nowait
+        write = stdin.write
+        flush = stdin.flush
+        empty = queue.Empty
+        fd = stdin.fileno() if _writev is not None else -1
+        while True:
+            data = get()
+            if data is None:
+                return
+            batch = [data, b"\n"]
+            append = batch.append
+            closing = False
+            while True:
+                try:
+                    data = get_nowait()
+                except empty:
+                    break
+                if data is None:
+                    closing = True
+                    break
+                append(data)
+                append(b"\n")
             try:
-                assert self.process and self.process.stdin
-                self.process.stdin.write(data + "\n")
-                self.process.stdin.flush()
+                if fd >= 0:
+                    _writev_all(fd, batch)
+                else:
+                    write(b"".join(batch))
+                    flush()
             except Exception:
                 pass
+            if closing:
+                return
 
-    def _read_stdout(self):
-        assert self.process and self.process.stdout
-        for line in self.process.stdout:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                msg = json.loads(line)
-            except Exception:
-                continue
-
-            # responses
-            if isinstance(msg, dict) and "id" in msg and (
-                "result" in msg or "error" in msg or "done" in msg
-            ):
-                msg_id = msg.get("id")
-                cb = self._callbacks.pop(msg_id, None)
-                it = self._iters.get(msg_id)
-                if cb is not None:
-                    try:
-                        cb(msg.get("error"), msg.get("result"))
-                    except Exception:
-                        pass
-                elif it is not None:
-                    done = bool(msg.get("done"))
-                    try:
-                        it(msg.get("error"), {"value": msg.get("result"), "done": done})
-                    except Exception:
-                        pass
-                    if done:
-                        self._iters.pop(msg_id, None)
-                continue
-
-            # requests from the server
-            if isinstance(msg, dict) and msg.get("method"):
-                method = msg["method"]
-                req_id = msg.get("id")
-                params = msg.get("params")
-                result = None
-                error = None
-                func = self.exports.get(method)
-                if func is None:
-                    error = f"Method not found: {method}"
+    def _read_pipes(self):
+        """Drain stdout and stderr from this one thread (POSIX only)."""
+        assert self.process and self.process.stdout and self.process.stderr
+        process = self.process
+        out_fd = process.stdout.fileno()
+        err_fd = process.stderr.fileno()
+        sel = selectors.DefaultSelector()
+        sel.register(out_fd, selectors.EVENT_READ)
+        sel.register(err_fd, selectors.EVENT_READ)
+        pending = bytearray()
+        err_pending = bytearray()
+        # Once stdout is gone, give stderr a moment for the exit message;
+        # it may stay open if a grandchild inherited it
+        deadline = None
+        last_poll = time.monotonic()
+        try:
+            while sel.get_map():
+                if deadline is None:
+                    timeout = 1.0
                 else:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                events = sel.select(timeout)
+                if deadline is None:
+                    # Catch an exit that left both pipes open, at most once a second
+                    now = time.monotonic()
+                    if now - last_poll >= 1.0:
+                        last_poll = now
+                        if process.poll() is not None:
+                            self._alive = False
+                for key, _ in events:
                     try:
-                        result = func(params)
-                    except Exception as e:
-                        error = f"{e}"
-                if req_id is not None:
-                    if error is not None:
-                        self._write_json({"jsonrpc": "2.0", "id": req_id, "error": {"message": error}})
+                        chunk = os.read(key.fd, 65536)
+                    except OSError:
+                        chunk = b""
+                    if key.fd == out_fd:
+                        if chunk:
+                            pending = self._feed_stdout(pending, chunk)
+                            continue
+                        sel.unregister(out_fd)
+                        self._stdout_closed(pending)
+                        deadline = time.monotonic() + 0.2
+                    elif chunk:
+                        err_pending = self._feed_stderr(err_pending, chunk)
                     else:
-                        self._write_json({"jsonrpc": "2.0", "id": req_id, "result": result})
+                        sel.unregister(err_fd)
+            if err_pending:
+                self._add_stderr(err_pending)
+        finally:
+            sel.close()
+        self._reject_pending()
+
+    def _read_stdout(self):
+        # Separate stdout thread where pipes can't be selected (Windows)
+        assert self.process and self.process.stdout
+        fd = self.process.stdout.fileno()
+        pending = bytearray()
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except OSError:
+                break
+            if not chunk:
+                break
+            pending = self._feed_stdout(pending, chunk)
+        self._stdout_closed(pending)
+        self._reject_pending()
+
+    def _feed_stdout(self, pending: bytearray, chunk: bytes) -> bytearray:
+        # Read big chunks straight from the fd (os.read releases the GIL) and
+        # split frames ourselves; one read usually carries many frames.
+        # Only the new chunk is searched, so a huge frame arriving in many
+        # reads stays linear.
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            pending += chunk
+            return pending
+        pending += chunk[:end]
+        for line in pending.split(b"\n"):
+            self._handle_line(line)
+        return bytearray(chunk[end + 1:])
 
+    def _stdout_closed(self, pending: bytearray):
+        if pending:
+            self._handle_line(pending)
+        self._alive = False
+
+    def _reject_pending(self):
         # process ended: reject callbacks
         if not self._closing:
             err_text = "\n".join(self._errbuf)
-            for _, cb in list(self._callbacks.items()):
+            for cb in self._callbacks.drain():
                 try:
                     cb({"message": err_text or "process exited"}, None)
                 except Exception:
                     pass
-            self._callbacks.clear()
-            for _, it in list(self._iters.items()):
+            for it in self._iters.drain():
                 try:
                     it({"message": err_text or "process exited"}, {"value": "", "done": True})
                 except Exception:
                     pass
-            self._iters.clear()
+
+    def _handle_line(self, line: bytes):
+        # Frames arrive already split on b"\n"; only a CRLF peer leaves
+        # anything to trim
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if not line:
+            return
+        try:
+            msg = _json_loads(line)
+        except Exception:
+            return
+
+        if not isinstance(msg, dict):
+            return
+        msg_id = msg.get("id")
+        method = msg.get("method")
+
+        # responses (the streamed-token hot path): an id and no method
+        if method is None:
+            if msg_id is None:
+                return
+            cb = self._callbacks.pop(msg_id)
+            if cb is not None:
+                try:
+                    cb(msg.get("error"), msg.get("result"))
+                except Exception:
+                    pass
+                return
+            it = self._iters.get(msg_id)
+            if it is not None:
+                # The server sends a real boolean
+                done = msg.get("done") is True
+                chunk = self._chunk
+                chunk["value"] = msg.get("result")
+                chunk["done"] = done
+                try:
+                    it(msg.get("error"), chunk)
+                except Exception:
+                    pass
+                if done:
+                    self._iters.pop(msg_id)
+            return
+
+        # requests from the server; exports can do file I/O, so they run on
+        # the export pool and reply from there while the reader keeps going
+        func = self.exports.get(method)
+        if func is None:
+            self._reply(msg_id, None, f"Method not found: {method}")
+            return
+        try:
+            future = self._export_pool.submit(func, msg.get("params"))
+        except RuntimeError:
+            # pool already shut down by stop()
+            return
+        if msg_id is not None:
+            future.add_done_callback(lambda f: self._reply_future(msg_id, f))
+
+    def _reply_future(self, msg_id: Any, future: concurrent.futures.Future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._reply(msg_id, None, f"{e}")
+        else:
+            self._reply(msg_id, result, None)
+
+    def _reply(self, msg_id: Any, result: Any, error: Optional[str]):
+        if msg_id is None:
+            return
+        if error is not None:
+            self._write_json({"jsonrpc": "2.0", "id": msg_id, "error": {"message": error}})
+        else:
+            self._write_json({"jsonrpc": "2.0", "id": msg_id, "result": result})
+
+    def _feed_stderr(self, pending: bytearray, chunk: bytes) -> bytearray:
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            pending += chunk
+            return pending
+        pending += chunk[:end]
+        for line in pending.split(b"\n"):
+            self._add_stderr(line)
+        return bytearray(chunk[end + 1:])
+
+    def _add_stderr(self, line: bytes):
+        self._errbuf.append(line.decode("utf-8", "replace").rstrip())
 
     def _read_stderr(self):
+        # Separate stderr thread where pipes can't be selected (Windows)
         assert self.process and self.process.stderr
-        for line in self.process.stderr:
-            self._errbuf.append(line.rstrip())
+        process = self.process
+        last_poll = time.monotonic()
+        for line in process.stderr:
+            self._add_stderr(line)
+            # Catch an exit that left stdout open, at most once a second
+            now = time.monotonic()
+            if now - last_poll >= 1.0:
+                last_poll = now
+                if process.poll() is not None:
+                    self._alive = False
+        if process.poll() is not None:
+            self._alive = False
+
+
+# Last resolution of _get_tune_bin_and_env, keyed by its raw inputs
+_tune_bin_cache: Dict[str, Any] = {"key": None, "value": None}
 
 
 def _get_tune_bin_and_env():
@@ -220,6 +578,22 @@ def _get_tune_bin_and_env():
         if not node_bin:
             node_bin = package_settings.get("tune-node-bin")
 
+    # Resolving walks PATH with a stat per entry; redo it only when the raw
+    # settings or PATH changed. Copies are returned since callers extend cmd.
+    # A bare "tune-sdk" means nothing was found; don't cache that so a later
+    # install is picked up.
+    key = (sdk_path, node_bin, os.environ.get("PATH", ""))
+    if _tune_bin_cache["key"] == key:
+        cmd, env = _tune_bin_cache["value"]
+    else:
+        cmd, env = _resolve_tune_bin(sdk_path, node_bin)
+        if cmd[0] != "tune-sdk":
+            _tune_bin_cache["key"] = key
+            _tune_bin_cache["value"] = (cmd, env)
+    return list(cmd), dict(env)
+
+
+def _resolve_tune_bin(sdk_path: Optional[str], node_bin: Optional[str]):
     env: Dict[str, str] = {}
 
     # If node_bin is provided, prepend it to PATH so both node and tune-sdk inside it are found